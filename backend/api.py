@@ -1,5 +1,8 @@
 from fastapi import  Request, APIRouter
-from pydantic import BaseModel
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse
+from pydantic import BaseModel, Field
+from typing import Optional
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
 from sklearn.model_selection import cross_val_score, train_test_split
@@ -8,11 +11,27 @@ import shap
 import numpy as np
 from fastapi.middleware.cors import CORSMiddleware
 from sklearn.utils import resample
-import random
-from sklearn.calibration import CalibratedClassifierCV
+
+import cohort
+import model
+import monitoring
+from cache import make_key, result_cache
 
 router = APIRouter()
 
+async def _get_bundle():
+    # Build the model off the event loop if this worker is still cold
+    if model.is_loaded():
+        return model.get_bundle()
+    return await run_in_threadpool(model.get_bundle)
+
+async def _cache_call(fn, *args):
+    # The shared cache tier does blocking SQLite I/O; keep it off the event loop
+    if result_cache.db_path:
+        return await run_in_threadpool(fn, *args)
+    return fn(*args)
+
+# The fields every /predict and /what-if payload must carry
 class PredictRequest(BaseModel):
     Age: int
     Gender: str
@@ -29,126 +48,41 @@ class PredictRequest(BaseModel):
     Medications: str
     Prior_Fractures: str
 
+# ...as the dataset spells them, which is what model.normalize() produces
+REQUIRED_FIELDS = [model.FIELD_ALIASES.get(name, name) for name in PredictRequest.model_fields]
+
 @router.post("/predict")
 async def predict(request: Request):
     try:
-        data = await request.json()
-        # Load data
-        df = pd.read_csv("./data/osteoporosis.csv")
-        # Synthetically generate nuanced negative cases for demo if needed
-        if (df["Osteoporosis"] == 0).sum() < 10:
-            n = min(500, len(df))
-            df_pos = df[df["Osteoporosis"] == 1].sample(n, random_state=42, replace=True)
-            negs = []
-            for i, row in df_pos.iterrows():
-                r = row.copy()
-                p = random.random()
-                if p < 0.6:  # 60% low risk
-                    r["Age"] = random.randint(18, 40)
-                    r["Gender"] = "Male"
-                    r["Hormonal Changes"] = "Normal"
-                    r["Family History"] = "No"
-                    r["Body Weight"] = "Normal"
-                    r["Calcium Intake"] = "Adequate"
-                    r["Vitamin D Intake"] = "Sufficient"
-                    r["Physical Activity"] = "Active"
-                    r["Smoking"] = "No"
-                    r["Alcohol Consumption"] = "None"
-                    r["Medical Conditions"] = "None"
-                    r["Medications"] = "None"
-                    r["Prior Fractures"] = "No"
-                elif p < 0.9:  # 30% moderate risk
-                    r["Age"] = random.randint(41, 60)
-                    r["Gender"] = random.choice(["Male", "Female"])
-                    r["Hormonal Changes"] = random.choice(["Normal", "Postmenopausal"])
-                    r["Family History"] = random.choice(["No", "Yes"])
-                    r["Body Weight"] = random.choice(["Normal", "Underweight"])
-                    r["Calcium Intake"] = random.choice(["Adequate", "Low"])
-                    r["Vitamin D Intake"] = random.choice(["Sufficient", "Insufficient"])
-                    r["Physical Activity"] = random.choice(["Active", "Sedentary"])
-                    r["Smoking"] = random.choice(["No", "Yes"])
-                    r["Alcohol Consumption"] = random.choice(["None", "Moderate"])
-                    r["Medical Conditions"] = random.choice(["None", "Rheumatoid Arthritis", "Hyperthyroidism"])
-                    r["Medications"] = random.choice(["None", "Corticosteroids"])
-                    r["Prior Fractures"] = random.choice(["No", "Yes"])
-                else:  # 10% borderline
-                    r["Age"] = random.randint(61, 75)
-                    r["Gender"] = random.choice(["Male", "Female"])
-                    r["Hormonal Changes"] = random.choice(["Normal", "Postmenopausal"])
-                    r["Family History"] = random.choice(["No", "Yes"])
-                    r["Body Weight"] = random.choice(["Normal", "Underweight"])
-                    r["Calcium Intake"] = random.choice(["Adequate", "Low"])
-                    r["Vitamin D Intake"] = random.choice(["Sufficient", "Insufficient"])
-                    r["Physical Activity"] = random.choice(["Active", "Sedentary"])
-                    r["Smoking"] = random.choice(["No", "Yes"])
-                    r["Alcohol Consumption"] = random.choice(["None", "Moderate"])
-                    r["Medical Conditions"] = random.choice(["None", "Rheumatoid Arthritis", "Hyperthyroidism"])
-                    r["Medications"] = random.choice(["None", "Corticosteroids"])
-                    r["Prior Fractures"] = random.choice(["No", "Yes"])
-                r["Osteoporosis"] = 0
-                negs.append(r)
-            df_neg = pd.DataFrame(negs)
-            df = pd.concat([df, df_neg], axis=0).reset_index(drop=True)
-        # Balance classes
-        df_majority = df[df.Osteoporosis == 1]
-        df_minority = df[df.Osteoporosis == 0]
-        if len(df_minority) > 0:
-            df_minority_upsampled = resample(
-                df_minority,
-                replace=True,
-                n_samples=len(df_majority),
-                random_state=42
-            )
-            df_balanced = pd.concat([df_majority, df_minority_upsampled], axis=0)
-            df_balanced = df_balanced.sample(frac=1, random_state=42)
-        else:
-            df_balanced = df
-        X = df_balanced.drop(columns=["Osteoporosis"])
-        y = df_balanced["Osteoporosis"]
-        # Remove Id column if present
-        if 'Id' in X.columns:
-            X = X.drop(columns=['Id'])
-        X = pd.get_dummies(X)
-        # Train calibrated model
-        from sklearn.ensemble import RandomForestClassifier
-        base_clf = RandomForestClassifier(n_estimators=100, random_state=42)
-        base_clf.fit(X, y)
-        clf = CalibratedClassifierCV(base_clf, cv=3, method="isotonic")
-        clf.fit(X, y)
-        # Prepare input for prediction
-        input_df = pd.DataFrame([data])
-        # Remove Id column if present
-        if 'Id' in input_df.columns:
-            input_df = input_df.drop(columns=['Id'])
-        input_df = pd.get_dummies(input_df)
-        # Align columns with training data
-        input_df = input_df.reindex(columns=X.columns, fill_value=0)
+        data = model.normalize(await request.json())
+        bundle = await _get_bundle()
+        model.validate(data, bundle["categories"], REQUIRED_FIELDS)
+        # Only inputs that get scored count towards drift
+        monitoring.observe(data)
+        columns = bundle["columns"]
+        # Prepare input for prediction, aligned with the training columns
+        input_df = model.encode([data], columns)
+        # Identical profiles (after encoding) are only scored once per model version
+        cache_key = make_key(bundle["version"], input_df)
+        cached = result_cache.get_memory(cache_key)
+        if cached is None:
+            cached = await _cache_call(result_cache.get, cache_key)
+        if cached is not None:
+            return cached
         # Check column alignment
-        if list(input_df.columns) != list(X.columns):
+        if list(input_df.columns) != list(columns):
             return {
                 "error": "input_df columns do not match training columns after reindexing.",
                 "input_df_columns": list(input_df.columns),
-                "training_columns": list(X.columns),
+                "training_columns": list(columns),
                 "input_df_shape": input_df.shape,
-                "X_shape": X.shape
+                "X_shape": (None, len(columns))
             }
         # Predict probability
-        proba = clf.predict_proba(input_df)[0][1]
-        # SHAP analysis for this patient (as before)
-        import shap
-        explainer = shap.TreeExplainer(base_clf)
-        shap_values = explainer.shap_values(input_df)
-        if isinstance(shap_values, list):
-            if len(shap_values) > 1:
-                shap_arr = shap_values[1][0]
-            else:
-                shap_arr = shap_values[0][0]
-        else:
-            shap_arr = shap_values[0]
-        shap_arr = np.ravel(shap_arr)
+        proba = model.predict_risk(bundle, input_df)[0]
+        # SHAP analysis for this patient, on the forest that produced the score
+        shap_arr = np.ravel(model.explain(bundle, input_df)[0])
         # SHAPE CHECK: Ensure shap_arr and input_df.columns match
-        if len(shap_arr) == 2 * len(input_df.columns):
-            shap_arr = shap_arr[::2]  # Take every other value (corresponding to the 1 state)
         if len(shap_arr) != len(input_df.columns):
             return {
                 "error": f"SHAP shape mismatch in /api/predict: shap_arr={len(shap_arr)}, columns={len(input_df.columns)}",
@@ -175,10 +109,91 @@ async def predict(request: Request):
                 "feature": feature,
                 "shap": float(shap_arr[i].item() if isinstance(shap_arr[i], np.ndarray) and shap_arr[i].size == 1 else shap_arr[i])
             })
-        return {"probability": float(proba.item() if isinstance(proba, np.ndarray) and proba.size == 1 else proba), "contributing_factors": contributing_factors}
+        result = {"probability": float(proba.item() if isinstance(proba, np.ndarray) and proba.size == 1 else proba), "contributing_factors": contributing_factors}
+        await _cache_call(result_cache.set, cache_key, result)
+        return result
+    except Exception as e:
+        return {"error": str(e)}
+
+@router.post("/what-if")
+async def what_if(request: Request, age_step: int = 5):
+    """Calibrated risk for every single-field change to a patient, scored as one batch"""
+    try:
+        data = model.normalize(await request.json())
+        bundle = await _get_bundle()
+        model.validate(data, bundle["categories"], REQUIRED_FIELDS)
+        low, high = bundle["age_range"]
+        ages = list(range(low, high + 1, max(1, age_step)))
+        changes = model.perturbations(data, bundle["categories"], ages)
+        # Row 0 is the patient as submitted, row i + 1 is changes[i]
+        input_df = model.encode([data] + [record for _, _, record in changes], bundle["columns"])
+        proba = model.predict_risk(bundle, input_df)
+        base = float(proba[0])
+        alternatives = []
+        age_sweep = []
+        for (field, value, _), p in zip(changes, proba[1:]):
+            if field == "Age":
+                age_sweep.append({"age": value, "probability": float(p)})
+            else:
+                alternatives.append({
+                    "feature": field,
+                    "current": data.get(field),
+                    "value": value,
+                    "probability": float(p),
+                    "risk_reduction": base - float(p)
+                })
+        alternatives.sort(key=lambda x: x["risk_reduction"], reverse=True)
+        return {"probability": base, "alternatives": alternatives, "age_sweep": age_sweep}
+    except Exception as e:
+        return {"error": str(e)}
+
+@router.get("/cache-stats")
+def get_cache_stats():
+    return result_cache.stats()
+
+@router.get("/drift")
+def get_drift():
+    """How far /predict inputs have moved from the training data (PSI and KL per feature)"""
+    try:
+        return monitoring.drift_report()
     except Exception as e:
         return {"error": str(e)}
 
+class CohortJobRequest(BaseModel):
+    path: str
+    chunksize: int = Field(50000, gt=0)
+    # Clamped to the CPU count by cohort.start_job
+    workers: Optional[int] = None
+    shap_sample: int = Field(2000, ge=0)
+
+@router.post("/cohort-jobs")
+def start_cohort_job(job: CohortJobRequest):
+    """Score a cohort CSV in the background; poll /cohort-jobs/{job_id} for progress"""
+    try:
+        return cohort.start_job(job.path, job.chunksize, job.workers, job.shap_sample)
+    except Exception as e:
+        return {"error": str(e)}
+
+@router.get("/cohort-jobs")
+def list_cohort_jobs():
+    return {"jobs": cohort.list_jobs()}
+
+@router.get("/cohort-jobs/{job_id}")
+def get_cohort_job(job_id: str):
+    status = cohort.read_status(job_id)
+    if status is None:
+        return {"error": f"Unknown cohort job: {job_id}"}
+    return status
+
+@router.get("/cohort-jobs/{job_id}/report")
+def get_cohort_report(job_id: str):
+    status = cohort.read_status(job_id)
+    if status is None:
+        return {"error": f"Unknown cohort job: {job_id}"}
+    if status["state"] != "completed":
+        return {"error": f"Cohort job {job_id} is {status['state']}", "status": status}
+    return FileResponse(cohort.report_path(job_id), media_type="application/json")
+
 @router.get("/data-science-metrics")
 def get_data_science_metrics():
     try:
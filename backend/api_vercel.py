@@ -1,4 +1,4 @@
-from fastapi import FastAPI, Request
+from fastapi import FastAPI, Request, Response
 from pydantic import BaseModel
 import pandas as pd
 from sklearn.ensemble import RandomForestClassifier
@@ -11,6 +11,8 @@ from sklearn.utils import resample
 import random
 from sklearn.calibration import CalibratedClassifierCV
 import os
+import threading
+import time
 
 app = FastAPI(title="BoneHealth AI API", version="1.0.0")
 
@@ -53,6 +55,53 @@ async def root():
 async def health_check():
     return {"status": "healthy", "service": "bonehealth-ai-backend"}
 
+# Seconds spent per warmup stage, or the error it raised, once per instance
+_warmup_timings = None
+_warmup_error = None
+
+def _warmup():
+    # Fit and explain a tiny forest so a cold instance pays the sklearn and
+    # SHAP (numba) initialisation cost here rather than on the first prediction.
+    # This doesn't train the 100-tree forest /api/predict fits per request.
+    global _warmup_timings, _warmup_error
+    try:
+        _warmup_timings = _warmup_stages()
+    except Exception as e:
+        _warmup_error = str(e)
+
+def _warmup_stages():
+    timings = {}
+    start = time.perf_counter()
+    X = pd.get_dummies(pd.DataFrame({"Age": [30, 70] * 10, "Smoking": ["No", "Yes"] * 10}))
+    y = [0, 1] * 10
+    clf = RandomForestClassifier(n_estimators=5, random_state=42).fit(X, y)
+    clf.predict_proba(X.iloc[[0]])
+    timings["model"] = time.perf_counter() - start
+    start = time.perf_counter()
+    shap.TreeExplainer(clf).shap_values(X.iloc[[0]])
+    timings["explainer"] = time.perf_counter() - start
+    return timings
+
+# Starts as soon as the instance imports the app, before any request
+threading.Thread(target=_warmup, daemon=True).start()
+
+@app.get("/ready")
+def readiness_check(response: Response):
+    if _warmup_timings is not None:
+        status = "ready"
+    elif _warmup_error:
+        status = "failed"
+    else:
+        status = "warming"
+    if status != "ready":
+        response.status_code = 503
+    return {
+        "status": status,
+        "service": "bonehealth-ai-backend",
+        "warmup": _warmup_timings,
+        "error": _warmup_error,
+    }
+
 @app.post("/api/predict")
 async def predict(request: Request):
     try:
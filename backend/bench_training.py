@@ -0,0 +1,158 @@
+#!/usr/bin/env python3
+"""
+Training benchmark for BoneHealth AI Backend
+Generates a synthetic cohort CSV with the osteoporosis.csv schema and builds
+the serving bundle from it (model.build_bundle: load, fit, categories,
+version, SHAP explainer and priming) with each training mode in a fresh
+process, reporting the time per stage and peak RSS as JSON.
+
+Usage (from the backend folder):
+    python bench_training.py --rows 1000000
+    python bench_training.py --rows 10000000 --modes chunked --output training.json
+"""
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+# field -> (categories, probabilities); None is written as "None", which
+# pandas reads back as missing like in osteoporosis.csv
+FIELDS = {
+    "Gender": (["Female", "Male"], None),
+    "Hormonal Changes": (["Normal", "Postmenopausal"], None),
+    "Family History": (["Yes", "No"], [0.3, 0.7]),
+    "Race/Ethnicity": (["Asian", "Caucasian", "African American"], None),
+    "Body Weight": (["Underweight", "Normal"], [0.3, 0.7]),
+    "Calcium Intake": (["Low", "Adequate"], None),
+    "Vitamin D Intake": (["Sufficient", "Insufficient"], None),
+    "Physical Activity": (["Sedentary", "Active"], None),
+    "Smoking": (["Yes", "No"], [0.2, 0.8]),
+    "Alcohol Consumption": (["Moderate", "None"], None),
+    "Medical Conditions": (["Rheumatoid Arthritis", "Hyperthyroidism", "None"], None),
+    "Medications": (["Corticosteroids", "None"], [0.2, 0.8]),
+    "Prior Fractures": (["Yes", "No"], [0.3, 0.7]),
+}
+
+# Risk factors and their weight in the synthetic outcome
+RISK = {
+    "Hormonal Changes": "Postmenopausal",
+    "Family History": "Yes",
+    "Body Weight": "Underweight",
+    "Calcium Intake": "Low",
+    "Vitamin D Intake": "Insufficient",
+    "Physical Activity": "Sedentary",
+    "Smoking": "Yes",
+    "Medications": "Corticosteroids",
+    "Prior Fractures": "Yes",
+}
+
+
+def generate_cohort(path, rows, chunksize=1000000, seed=42):
+    """Write a synthetic cohort to path in chunks"""
+    rng = np.random.default_rng(seed)
+    written = 0
+    with open(path, "w", newline="") as f:
+        while written < rows:
+            n = min(chunksize, rows - written)
+            chunk = {"Id": np.arange(written, written + n), "Age": rng.integers(18, 91, n)}
+            for field, (options, p) in FIELDS.items():
+                chunk[field] = rng.choice(options, n, p=p)
+            score = (chunk["Age"] - 50) / 10.0
+            for field, value in RISK.items():
+                score = score + 0.5 * (chunk[field] == value)
+            chunk["Osteoporosis"] = (score + rng.normal(0, 1, n) > 1.5).astype(int)
+            pd.DataFrame(chunk).to_csv(f, header=written == 0, index=False)
+            written += n
+
+
+def peak_rss_mb():
+    """Peak RSS of this process. Prefers VmHWM because Linux carries
+    ru_maxrss over from the parent across exec."""
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith("VmHWM:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KB on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def train(mode, path):
+    """Build the serving bundle with one mode in this process and return its timings"""
+    import model
+
+    start = time.perf_counter()
+    bundle = model.build_bundle(path, mode)
+    total_s = time.perf_counter() - start
+    timings = model.warmup_status()["timings"]
+    return {
+        "mode": mode,
+        "features": len(bundle["columns"]),
+        "load_s": timings["data"],
+        "fit_s": timings["model"],
+        "explainer_s": timings["explainer"],
+        "prime_s": timings["prime"],
+        # categories(), model_version() and the rest of build_bundle
+        "other_s": total_s - sum(timings.values()),
+        "total_s": total_s,
+        "node_count": int(sum(tree.tree_.node_count for tree in bundle["base_clf"].estimators_)),
+        "version": bundle["version"],
+        "peak_rss_mb": peak_rss_mb(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare training modes on a synthetic cohort")
+    parser.add_argument("--rows", type=int, default=1000000)
+    parser.add_argument("--data", default="./data/bench_cohort.csv", help="cohort CSV to generate and train on")
+    parser.add_argument("--reuse", action="store_true", help="train on an existing --data file")
+    parser.add_argument("--modes", default="default,chunked")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--child", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(train(args.child, args.data)))
+        return
+
+    if not (args.reuse and os.path.exists(args.data)):
+        start = time.perf_counter()
+        generate_cohort(args.data, args.rows)
+        print(f"Generated {args.rows} rows in {time.perf_counter() - start:.1f}s", file=sys.stderr)
+
+    report = {"rows": args.rows, "data": args.data, "cpu_count": os.cpu_count(), "modes": {}}
+    for mode in args.modes.split(","):
+        # A fresh process per mode so peak RSS isn't shared between them
+        proc = subprocess.run(
+            [sys.executable, os.path.abspath(__file__), "--child", mode, "--data", args.data],
+            capture_output=True, text=True
+        )
+        if proc.returncode != 0:
+            report["modes"][mode] = {"error": proc.stderr.strip().splitlines()[-1:], "returncode": proc.returncode}
+            print(f"❌ {mode}: exited with {proc.returncode}", file=sys.stderr)
+            continue
+        result = json.loads(proc.stdout.strip().splitlines()[-1])
+        report["modes"][mode] = result
+        print(f"✅ {mode}: fit {result['fit_s']:.1f}s, total {result['total_s']:.1f}s, "
+              f"peak RSS {result['peak_rss_mb']:.0f} MB", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Benchmark harness for BoneHealth AI Backend
+Starts the FastAPI app in-process (no network) and drives its endpoints with
+configurable concurrency, reporting throughput, latency percentiles and RSS
+per scenario as JSON.
+
+Usage (from the backend folder):
+    python benchmark.py --requests 50 --concurrency 4 --output results.json
+    python benchmark.py --baseline results.json --threshold 0.2
+    python benchmark.py --scale-workers 1,2,4 --requests 200 --concurrency 16
+    python benchmark.py --scenarios predict_unique --monitor-overhead 100000
+
+--scale-workers is the one mode that uses the loopback network: it starts
+gunicorn (gunicorn.conf.py) once per worker count and measures /api/predict
+throughput and server memory against it.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import time
+
+import httpx
+import numpy as np
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, BACKEND_DIR)
+
+from main import app
+import model
+import monitoring
+
+SAMPLE_PATIENT = {
+    "Age": 65,
+    "Gender": "Female",
+    "Hormonal Changes": "Postmenopausal",
+    "Family History": "Yes",
+    "Race/Ethnicity": "Caucasian",
+    "Body Weight": "Underweight",
+    "Calcium Intake": "Low",
+    "Vitamin D Intake": "Insufficient",
+    "Physical Activity": "Sedentary",
+    "Smoking": "No",
+    "Alcohol Consumption": "None",
+    "Medical Conditions": "None",
+    "Medications": "None",
+    "Prior Fractures": "No"
+}
+
+PATIENT_OPTIONS = {
+    "Gender": ["Female", "Male"],
+    "Hormonal Changes": ["Normal", "Postmenopausal"],
+    "Family History": ["Yes", "No"],
+    "Race/Ethnicity": ["Asian", "Caucasian", "African American"],
+    "Body Weight": ["Underweight", "Normal"],
+    "Calcium Intake": ["Low", "Adequate"],
+    "Vitamin D Intake": ["Sufficient", "Insufficient"],
+    "Physical Activity": ["Sedentary", "Active"],
+    "Smoking": ["Yes", "No"],
+    "Alcohol Consumption": ["Moderate", "None"],
+    "Medical Conditions": ["Rheumatoid Arthritis", "Hyperthyroidism", "None"],
+    "Medications": ["Corticosteroids", "None"],
+    "Prior Fractures": ["Yes", "No"],
+}
+
+_rng = random.Random(42)
+
+
+def random_patient():
+    """A fresh profile per request, so predictions bypass the result cache"""
+    patient = {field: _rng.choice(options) for field, options in PATIENT_OPTIONS.items()}
+    patient["Age"] = _rng.randint(18, 90)
+    return patient
+
+
+# name -> (method, path, json body or a function returning one per request)
+SCENARIOS = {
+    "health": ("GET", "/health", None),
+    "predict": ("POST", "/api/predict", SAMPLE_PATIENT),
+    "predict_unique": ("POST", "/api/predict", random_patient),
+    "what_if": ("POST", "/api/what-if", random_patient),
+    "drift": ("GET", "/api/drift", None),
+    "metrics": ("GET", "/api/data-science-metrics", None),
+}
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS and KB on Linux
+    return peak / 1024 ** 2 if sys.platform == "darwin" else peak / 1024
+
+
+def rss_mb():
+    """Current resident set size of this process in MB"""
+    try:
+        with open("/proc/self/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1024 ** 2
+    except (OSError, ValueError):
+        return peak_rss_mb()
+
+
+async def run_scenario(client, name, n_requests, concurrency):
+    method, path, body = SCENARIOS[name]
+    latencies = []
+    errors = 0
+    queue = asyncio.Queue()
+    for _ in range(n_requests):
+        queue.put_nowait(None)
+
+    async def worker():
+        nonlocal errors
+        while True:
+            try:
+                queue.get_nowait()
+            except asyncio.QueueEmpty:
+                return
+            payload = body() if callable(body) else body
+            start = time.perf_counter()
+            response = await client.request(method, path, json=payload)
+            latencies.append(time.perf_counter() - start)
+            # The API reports failures as {"error": ...} with a 200 status
+            if response.status_code != 200 or "error" in response.json():
+                errors += 1
+
+    rss_before = rss_mb()
+    start = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies_ms = np.array(latencies) * 1000
+    return {
+        "requests": n_requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "elapsed_s": elapsed,
+        "throughput_rps": n_requests / elapsed if elapsed > 0 else 0.0,
+        "latency_ms": {
+            "mean": float(latencies_ms.mean()),
+            "p50": float(np.percentile(latencies_ms, 50)),
+            "p95": float(np.percentile(latencies_ms, 95)),
+            "p99": float(np.percentile(latencies_ms, 99)),
+            "max": float(latencies_ms.max()),
+        },
+        "rss_mb": {"before": rss_before, "after": rss_mb()},
+    }
+
+
+async def run_benchmark(scenarios, n_requests, concurrency, warmup):
+    results = {}
+    transport = httpx.ASGITransport(app=app)
+    # ASGITransport does not send lifespan events, so run them ourselves
+    async with app.router.lifespan_context(app):
+        # The lifespan only starts warmup in a thread; wait for it so the first
+        # scenario doesn't compete with training
+        await asyncio.to_thread(model.get_bundle)
+        async with httpx.AsyncClient(transport=transport, base_url="http://benchmark", timeout=None) as client:
+            for name in scenarios:
+                if warmup:
+                    await run_scenario(client, name, warmup, 1)
+                requests = n_requests.get(name, n_requests["default"])
+                results[name] = await run_scenario(client, name, requests, concurrency)
+                print(f"✅ {name}: {results[name]['throughput_rps']:.2f} req/s, "
+                      f"p95 {results[name]['latency_ms']['p95']:.1f} ms", file=sys.stderr)
+    return results
+
+
+def _free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def server_memory_mb(pid):
+    """RSS and PSS of a process and its children; PSS splits shared pages
+    between the processes sharing them, so it shows copy-on-write savings"""
+    pids = [pid]
+    try:
+        with open(f"/proc/{pid}/task/{pid}/children") as f:
+            pids += [int(p) for p in f.read().split()]
+    except OSError:
+        return None
+    totals = {"rss": 0.0, "pss": 0.0}
+    for p in pids:
+        try:
+            with open(f"/proc/{p}/smaps_rollup") as f:
+                for line in f:
+                    key = line.split(":")[0].lower()
+                    if key in totals:
+                        totals[key] += int(line.split()[1]) / 1024
+        except OSError:
+            continue
+    return {"processes": len(pids), "rss": totals["rss"], "pss": totals["pss"]}
+
+
+async def _wait_ready(client, proc, timeout=600):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError(f"gunicorn exited with status {proc.returncode}")
+        try:
+            if (await client.get("/ready")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.5)
+    raise RuntimeError("server did not become ready in time")
+
+
+async def run_scaling(worker_counts, n_requests, concurrency, warmup):
+    results = {}
+    for workers in worker_counts:
+        port = _free_port()
+        env = dict(os.environ, WEB_CONCURRENCY=str(workers), HOST="127.0.0.1", PORT=str(port))
+        proc = subprocess.Popen(
+            [sys.executable, "-m", "gunicorn", "main:app", "-c", "gunicorn.conf.py"],
+            cwd=BACKEND_DIR, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL
+        )
+        try:
+            async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=None) as client:
+                await _wait_ready(client, proc)
+                if warmup:
+                    await run_scenario(client, "predict_unique", warmup * workers, workers)
+                result = await run_scenario(client, "predict_unique", n_requests, concurrency)
+            result["server_memory_mb"] = server_memory_mb(proc.pid)
+            results[workers] = result
+        finally:
+            proc.terminate()
+            proc.wait()
+        print(f"✅ {workers} worker(s): {result['throughput_rps']:.2f} req/s, "
+              f"p95 {result['latency_ms']['p95']:.1f} ms", file=sys.stderr)
+    base = results[worker_counts[0]]["throughput_rps"]
+    for workers, result in results.items():
+        result["speedup"] = result["throughput_rps"] / base if base > 0 else None
+    return {str(workers): result for workers, result in results.items()}
+
+
+def monitor_overhead(n):
+    """Per-call latency of monitoring.observe, which runs on every /api/predict"""
+    records = [model.normalize(random_patient()) for _ in range(n)]
+    timings = np.empty(n)
+    for i, record in enumerate(records):
+        start = time.perf_counter()
+        monitoring.observe(record)
+        timings[i] = time.perf_counter() - start
+    timings_us = timings * 1e6
+    return {
+        "calls": n,
+        "latency_us": {
+            "mean": float(timings_us.mean()),
+            "p50": float(np.percentile(timings_us, 50)),
+            "p99": float(np.percentile(timings_us, 99)),
+            "max": float(timings_us.max()),
+        },
+    }
+
+
+def compare(results, baseline, threshold):
+    """Return a list of regressions against a previous run"""
+    regressions = []
+    for name, current in results.items():
+        previous = baseline.get("scenarios", {}).get(name)
+        if previous is None:
+            continue
+        for pct in ("p50", "p95", "p99"):
+            before = previous["latency_ms"][pct]
+            after = current["latency_ms"][pct]
+            if before > 0 and after > before * (1 + threshold):
+                regressions.append(f"{name} {pct} latency {before:.1f} ms -> {after:.1f} ms")
+        before = previous["throughput_rps"]
+        after = current["throughput_rps"]
+        if before > 0 and after < before * (1 - threshold):
+            regressions.append(f"{name} throughput {before:.2f} -> {after:.2f} req/s")
+        if current["errors"] > previous["errors"]:
+            regressions.append(f"{name} errors {previous['errors']} -> {current['errors']}")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="BoneHealth AI in-process benchmark")
+    parser.add_argument("--scenarios", default="health,predict,predict_unique,what_if,metrics",
+                        help=f"comma-separated subset of: {', '.join(SCENARIOS)}")
+    parser.add_argument("--requests", type=int, default=50, help="requests per scenario")
+    parser.add_argument("--metrics-requests", type=int, default=3,
+                        help="requests for the (slow) metrics scenario")
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--warmup", type=int, default=1, help="untimed requests before each scenario")
+    parser.add_argument("--scale-workers",
+                        help="comma-separated gunicorn worker counts to measure predict throughput scaling")
+    parser.add_argument("--monitor-overhead", type=int, metavar="N",
+                        help="also time N calls of the drift monitor's per-request update")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--baseline", help="previous JSON report to compare against")
+    parser.add_argument("--threshold", type=float, default=0.2,
+                        help="allowed relative regression before failing (0.2 = 20%%)")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = [s for s in scenarios if s not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(unknown)}")
+
+    report = {
+        "python": sys.version.split()[0],
+        "cpu_count": os.cpu_count(),
+    }
+    if args.scale_workers:
+        worker_counts = [int(n) for n in args.scale_workers.split(",")]
+        report["scaling"] = asyncio.run(
+            run_scaling(worker_counts, args.requests, args.concurrency, args.warmup)
+        )
+        results = {}
+    else:
+        n_requests = {"default": args.requests, "metrics": args.metrics_requests}
+        results = asyncio.run(run_benchmark(scenarios, n_requests, args.concurrency, args.warmup))
+        report["peak_rss_mb"] = peak_rss_mb()
+        report["scenarios"] = results
+    if args.monitor_overhead:
+        report["monitor_overhead"] = monitor_overhead(args.monitor_overhead)
+        latency = report["monitor_overhead"]["latency_us"]
+        print(f"✅ monitor: mean {latency['mean']:.1f} us, p99 {latency['p99']:.1f} us per request",
+              file=sys.stderr)
+
+    exit_code = 0
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold)
+        report["regressions"] = regressions
+        for line in regressions:
+            print(f"❌ Regression: {line}", file=sys.stderr)
+        if regressions:
+            exit_code = 1
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+    sys.exit(exit_code)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,175 @@
+"""
+Prediction result cache for BoneHealth AI Backend
+Identical patient profiles are scored once. Results are keyed by a hash of
+the model version and the encoded feature row, so any two payloads the model
+sees as the same patient share an entry, and retraining invalidates them.
+
+There are two tiers:
+- an in-process LRU (BONEHEALTH_CACHE_SIZE entries)
+- an optional SQLite file shared by every worker on the host
+  (BONEHEALTH_CACHE_DB, capped at BONEHEALTH_CACHE_DB_SIZE entries)
+Entries in both tiers expire after BONEHEALTH_CACHE_TTL seconds.
+
+The shared tier does blocking file I/O, so async callers should check the
+memory tier with get_memory() and run get()/set() in a thread when shared.
+SQLite calls hold their own lock, never the memory tier's, so a slow or
+busy database doesn't stall memory hits.
+"""
+
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+
+def make_key(version, input_df):
+    """Canonical key for one encoded (one-hot, column-aligned) input row"""
+    row = json.dumps([float(v) for v in input_df.iloc[0].tolist()])
+    return hashlib.sha256(f"{version}:{row}".encode()).hexdigest()
+
+
+class ResultCache:
+    def __init__(self, max_entries=1024, ttl=3600, db_path=None, max_db_entries=100000):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.db_path = db_path
+        self.max_db_entries = max_db_entries
+        self._memory = OrderedDict()  # key -> (expires, value)
+        self._lock = threading.Lock()
+        self._db_lock = threading.Lock()  # serializes use of the SQLite connection
+        self._conn = None
+        self._conn_pid = None
+        self._sets_since_prune = 0
+        self._stats = {"memory_hits": 0, "shared_hits": 0, "misses": 0, "sets": 0, "evictions": 0, "expired": 0}
+
+    @classmethod
+    def from_env(cls):
+        return cls(
+            max_entries=int(os.environ.get("BONEHEALTH_CACHE_SIZE", 1024)),
+            ttl=float(os.environ.get("BONEHEALTH_CACHE_TTL", 3600)),
+            db_path=os.environ.get("BONEHEALTH_CACHE_DB") or None,
+            max_db_entries=int(os.environ.get("BONEHEALTH_CACHE_DB_SIZE", 100000)),
+        )
+
+    def _db(self):
+        # SQLite connections must not cross a fork, so open one per process
+        if self._conn is None or self._conn_pid != os.getpid():
+            # The shared tier is best-effort, so don't wait long for a busy writer
+            conn = sqlite3.connect(self.db_path, timeout=0.5, check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS results "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS results_expires ON results (expires)")
+            self._conn = conn
+            self._conn_pid = os.getpid()
+        return self._conn
+
+    def _remember(self, key, expires, value):
+        self._memory[key] = (expires, value)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+            self._stats["evictions"] += 1
+
+    def get_memory(self, key):
+        """Look up the memory tier only; never blocks on I/O. A miss isn't
+        counted, since the caller is expected to follow up with get()."""
+        now = time.time()
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is None:
+                return None
+            if entry[0] > now:
+                self._memory.move_to_end(key)
+                self._stats["memory_hits"] += 1
+                return entry[1]
+            del self._memory[key]
+            self._stats["expired"] += 1
+            return None
+
+    def get(self, key):
+        value = self.get_memory(key)
+        if value is not None:
+            return value
+        if self.db_path:
+            try:
+                with self._db_lock:
+                    row = self._db().execute(
+                        "SELECT value, expires FROM results WHERE key = ? AND expires > ?", (key, time.time())
+                    ).fetchone()
+            except sqlite3.Error:
+                row = None
+            if row is not None:
+                value = json.loads(row[0])
+                with self._lock:
+                    self._remember(key, row[1], value)
+                    self._stats["shared_hits"] += 1
+                return value
+        with self._lock:
+            self._stats["misses"] += 1
+        return None
+
+    def set(self, key, value):
+        expires = time.time() + self.ttl
+        with self._lock:
+            self._remember(key, expires, value)
+            self._stats["sets"] += 1
+        if self.db_path:
+            try:
+                with self._db_lock:
+                    db = self._db()
+                    db.execute(
+                        "INSERT OR REPLACE INTO results (key, value, expires) VALUES (?, ?, ?)",
+                        (key, json.dumps(value), expires)
+                    )
+                    self._sets_since_prune += 1
+                    if self._sets_since_prune >= 256:
+                        self._prune(db)
+            except sqlite3.Error:
+                # The shared tier is best-effort; the memory tier still works
+                pass
+
+    def _prune(self, db):
+        # Drop expired rows, then the rows closest to expiry beyond the size cap
+        self._sets_since_prune = 0
+        db.execute("DELETE FROM results WHERE expires <= ?", (time.time(),))
+        db.execute(
+            "DELETE FROM results WHERE key IN "
+            "(SELECT key FROM results ORDER BY expires DESC LIMIT -1 OFFSET ?)",
+            (self.max_db_entries,)
+        )
+
+    def clear(self):
+        with self._lock:
+            self._memory.clear()
+        if self.db_path:
+            with self._db_lock:
+                self._db().execute("DELETE FROM results")
+
+    def stats(self):
+        """Hit/miss counters for this worker plus the size of each tier"""
+        with self._lock:
+            stats = dict(self._stats)
+            stats["memory_entries"] = len(self._memory)
+        if self.db_path:
+            try:
+                with self._db_lock:
+                    stats["shared_entries"] = self._db().execute("SELECT COUNT(*) FROM results").fetchone()[0]
+            except sqlite3.Error:
+                stats["shared_entries"] = None
+        lookups = stats["memory_hits"] + stats["shared_hits"] + stats["misses"]
+        stats["hit_rate"] = (stats["memory_hits"] + stats["shared_hits"]) / lookups if lookups else 0.0
+        stats["pid"] = os.getpid()
+        stats["max_entries"] = self.max_entries
+        stats["ttl_seconds"] = self.ttl
+        stats["shared"] = self.db_path is not None
+        return stats
+
+
+result_cache = ResultCache.from_env()
@@ -0,0 +1,432 @@
+"""
+Cohort risk-stratification jobs for BoneHealth AI Backend
+A job scores every patient in a cohort CSV with a process pool, folds each
+chunk's results into running aggregates (risk tiers, risk histogram,
+per-segment statistics and mean SHAP attributions), and writes the report to
+disk for the dashboard to fetch.
+
+Job status and reports live in REPORTS_DIR rather than in memory, so any
+gunicorn worker can answer a poll for a job another worker is running. At
+most BONEHEALTH_COHORT_MAX_JOBS jobs run at once per REPORTS_DIR, and each
+uses at most one scoring process per CPU.
+
+Rows with a category the model wasn't trained on (a different spelling,
+say) are left out of the aggregates rather than scored as "none of the
+options". The status and report count them per field and value.
+
+A job runs in a thread of the process that accepted it, which records its
+pid and refreshes a heartbeat in the status file. If that process dies (a
+worker timeout, a HUP reload, a crash) the job is reported as failed instead
+of "running" forever.
+
+Usage (from the backend folder), to run a job in the foreground:
+    python cohort.py cohort.csv --workers 4
+"""
+
+import argparse
+import fcntl
+import json
+import multiprocessing
+import os
+import sys
+import threading
+import time
+import uuid
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+import shap
+
+import model
+
+# Cohort files are only read from here
+COHORT_DIR = os.environ.get("BONEHEALTH_COHORT_DIR", "./data")
+REPORTS_DIR = os.environ.get("BONEHEALTH_REPORTS_DIR", "./reports")
+# Jobs allowed to be queued or running at once; extra ones are rejected
+MAX_JOBS = int(os.environ.get("BONEHEALTH_COHORT_MAX_JOBS", 1))
+ACTIVE_STATES = ("queued", "running")
+HEARTBEAT_INTERVAL = 10
+# A job whose owner hasn't written its status for this long is presumed dead
+STALE_AFTER = 6 * HEARTBEAT_INTERVAL
+
+# Same cut-offs as the dashboard's risk labels
+RISK_TIERS = [("low", 0.0), ("moderate", 0.3), ("high", 0.7)]
+AGE_BANDS = [0, 40, 50, 60, 70, 80]
+AGE_BAND_LABELS = [f"<{AGE_BANDS[1]}"] + [f"{low}-{high - 1}" for low, high in zip(AGE_BANDS[1:-1], AGE_BANDS[2:])] + [f"{AGE_BANDS[-1]}+"]
+SEGMENT_FIELDS = ["Gender", "Race/Ethnicity"]
+# Distinct unknown values listed per field; the rest only add to the row count
+MAX_UNKNOWN_VALUES = 20
+
+_jobs = {}  # job_id -> thread, for jobs started by this process
+
+# Set in each pool process by _init_worker
+_worker_bundle = None
+
+
+def resolve_cohort_path(path):
+    """Absolute path of a cohort file, which must be inside COHORT_DIR"""
+    root = os.path.realpath(COHORT_DIR)
+    full = os.path.realpath(os.path.join(root, path))
+    if os.path.commonpath([root, full]) != root:
+        raise ValueError(f"Cohort files must be inside {COHORT_DIR}")
+    if not os.path.isfile(full):
+        raise ValueError(f"Cohort file not found: {path}")
+    return full
+
+
+def _status_path(job_id):
+    return os.path.join(REPORTS_DIR, f"cohort_{job_id}.status.json")
+
+
+def report_path(job_id):
+    return os.path.join(REPORTS_DIR, f"cohort_{job_id}.json")
+
+
+def _write_json(path, data):
+    # Write then rename, so readers never see a partial file
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(data, f)
+    os.replace(tmp, path)
+
+
+def _owner_alive(status):
+    if time.time() - status.get("heartbeat", status["created_at"]) > STALE_AFTER:
+        return False
+    try:
+        os.kill(status["pid"], 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, but belongs to another user
+    return True
+
+
+def read_status(job_id):
+    if not job_id.isalnum():
+        return None
+    try:
+        with open(_status_path(job_id)) as f:
+            status = json.load(f)
+    except FileNotFoundError:
+        return None
+    if status["state"] in ACTIVE_STATES and not _owner_alive(status):
+        # Reported, not written back, so a merely slow owner can still finish
+        status.update(state="failed", error=f"Job owner (pid {status['pid']}) exited or stopped responding")
+    return status
+
+
+def list_jobs():
+    if not os.path.isdir(REPORTS_DIR):
+        return []
+    jobs = []
+    for name in os.listdir(REPORTS_DIR):
+        if name.startswith("cohort_") and name.endswith(".status.json"):
+            status = read_status(name[len("cohort_"):-len(".status.json")])
+            if status is not None:
+                jobs.append(status)
+    return sorted(jobs, key=lambda job: job["created_at"], reverse=True)
+
+
+def count_rows(path):
+    """Data rows in a CSV (excluding the header), counted without parsing"""
+    with open(path, "rb") as f:
+        lines = sum(block.count(b"\n") for block in iter(lambda: f.read(1 << 20), b""))
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) != b"\n":
+            lines += 1
+    return max(lines - 1, 0)
+
+
+def _init_worker(base_clf, calibration, columns, categories):
+    global _worker_bundle
+    _worker_bundle = {
+        "base_clf": base_clf,
+        "calibration": calibration,
+        "columns": columns,
+        "categories": categories,
+        "explainer": shap.TreeExplainer(base_clf),
+    }
+
+
+def _tier(risk):
+    """Index into RISK_TIERS for each risk"""
+    return np.searchsorted([cut for _, cut in RISK_TIERS[1:]], risk, side="right")
+
+
+def _age_band(age):
+    index = np.searchsorted(AGE_BANDS, age, side="right") - 1
+    return np.where(np.isnan(age), "Unknown", np.array(AGE_BAND_LABELS)[np.clip(index, 0, len(AGE_BAND_LABELS) - 1)])
+
+
+def _segment_order(item):
+    # Age bands in age order, everything else alphabetically
+    value = item[0]
+    return (AGE_BAND_LABELS.index(value), "") if value in AGE_BAND_LABELS else (len(AGE_BAND_LABELS), value)
+
+
+def _check_categories(chunk, field_categories):
+    """Mask of the rows whose categories the model knows, and the unknown
+    values per field with their row counts, as model.validate checks requests"""
+    missing = [field for field in field_categories if field not in chunk]
+    if missing:
+        raise ValueError(f"Cohort file is missing columns: {', '.join(missing)}")
+    valid = np.ones(len(chunk), dtype=bool)
+    unknown = {}
+    for field, options in field_categories.items():
+        # The CSV reads "None" as missing, which is how requests spell it
+        values = chunk[field].fillna("None").astype(str)
+        known = values.isin(options).to_numpy()
+        if not known.all():
+            counts = values[~known].value_counts().head(MAX_UNKNOWN_VALUES)
+            unknown[field] = {"rows": int((~known).sum()), "values": {str(v): int(n) for v, n in counts.items()}}
+        valid &= known
+    return valid, unknown
+
+
+def score_chunk(chunk, shap_fraction, seed):
+    """Score the valid rows of one chunk and return its partial aggregates"""
+    bundle = _worker_bundle
+    chunk = chunk.rename(columns=model.FIELD_ALIASES)
+    rows = len(chunk)
+    valid, unknown = _check_categories(chunk, bundle["categories"])
+    chunk = chunk[valid]
+    features = chunk.drop(columns=["Id", "Osteoporosis"], errors="ignore")
+    input_df = pd.get_dummies(features).reindex(columns=bundle["columns"], fill_value=0).astype(float)
+    risk = model.predict_risk(bundle, input_df) if len(input_df) else np.zeros(0)
+    tiers = _tier(risk)
+
+    segments = {}
+    keys = {"Age band": _age_band(chunk["Age"].to_numpy(dtype=float))} if "Age" in chunk else {}
+    for field in SEGMENT_FIELDS:
+        if field in chunk:
+            keys[field] = chunk[field].fillna("Unknown").astype(str).to_numpy()
+    for field, values in keys.items():
+        frame = pd.DataFrame({"value": values, "risk": risk, "tier": tiers})
+        grouped = frame.groupby("value")
+        tier_counts = pd.crosstab(frame["value"], frame["tier"]).reindex(columns=range(len(RISK_TIERS)), fill_value=0)
+        segments[field] = {
+            value: {
+                "count": int(count),
+                "risk_sum": float(risk_sum),
+                "tiers": tier_counts.loc[value].tolist(),
+            }
+            for value, count, risk_sum in zip(grouped.size().index, grouped.size(), grouped["risk"].sum())
+        }
+
+    # SHAP costs milliseconds per row, so mean attributions come from the same
+    # fraction of every chunk rather than from every patient
+    shap_rows = min(len(input_df), int(np.ceil(shap_fraction * len(input_df))))
+    if shap_rows:
+        shap_values = model.explain(bundle, input_df.sample(shap_rows, random_state=seed))
+    else:
+        shap_values = np.zeros((0, input_df.shape[1]))
+
+    return {
+        "rows": rows,
+        "invalid_rows": rows - len(chunk),
+        "unknown_categories": unknown,
+        "risk_sum": float(risk.sum()),
+        "tiers": np.bincount(tiers, minlength=len(RISK_TIERS)).tolist(),
+        "histogram": np.histogram(risk, bins=10, range=(0, 1))[0].tolist(),
+        "segments": segments,
+        "shap_rows": len(shap_values),
+        "shap_sum": np.asarray(shap_values).sum(axis=0).tolist(),
+        "shap_abs_sum": np.abs(shap_values).sum(axis=0).tolist(),
+    }
+
+
+def _merge(total, part):
+    total["rows"] += part["rows"]
+    total["invalid_rows"] += part["invalid_rows"]
+    for field, found in part["unknown_categories"].items():
+        merged = total["unknown_categories"].setdefault(field, {"rows": 0, "values": {}})
+        merged["rows"] += found["rows"]
+        for value, n in found["values"].items():
+            if value in merged["values"] or len(merged["values"]) < MAX_UNKNOWN_VALUES:
+                merged["values"][value] = merged["values"].get(value, 0) + n
+    total["risk_sum"] += part["risk_sum"]
+    total["tiers"] = [a + b for a, b in zip(total["tiers"], part["tiers"])]
+    total["histogram"] = [a + b for a, b in zip(total["histogram"], part["histogram"])]
+    for field, values in part["segments"].items():
+        merged = total["segments"].setdefault(field, {})
+        for value, stats in values.items():
+            current = merged.setdefault(value, {"count": 0, "risk_sum": 0.0, "tiers": [0] * len(RISK_TIERS)})
+            current["count"] += stats["count"]
+            current["risk_sum"] += stats["risk_sum"]
+            current["tiers"] = [a + b for a, b in zip(current["tiers"], stats["tiers"])]
+    total["shap_rows"] += part["shap_rows"]
+    total["shap_sum"] += np.asarray(part["shap_sum"])
+    total["shap_abs_sum"] += np.asarray(part["shap_abs_sum"])
+
+
+def _tier_summary(counts):
+    n = sum(counts)
+    return {name: {"count": c, "share": c / n if n else 0.0} for (name, _), c in zip(RISK_TIERS, counts)}
+
+
+def _build_report(status, total, columns):
+    rows = total["rows"] - total["invalid_rows"]
+    shap_rows = max(total["shap_rows"], 1)
+    attributions = [
+        {"feature": f, "mean_shap": float(s / shap_rows), "mean_abs_shap": float(a / shap_rows)}
+        for f, s, a in zip(columns, total["shap_sum"], total["shap_abs_sum"])
+    ]
+    return {
+        **status,
+        "mean_risk": total["risk_sum"] / rows if rows else None,
+        "risk_tiers": _tier_summary(total["tiers"]),
+        "risk_tier_cutoffs": {name: cut for name, cut in RISK_TIERS},
+        "prob_dist": {"hist": total["histogram"], "bin_edges": np.linspace(0, 1, 11).tolist()},
+        "segments": {
+            field: {
+                value: {
+                    "count": stats["count"],
+                    "mean_risk": stats["risk_sum"] / stats["count"],
+                    "risk_tiers": _tier_summary(stats["tiers"]),
+                }
+                for value, stats in sorted(values.items(), key=_segment_order)
+            }
+            for field, values in total["segments"].items()
+        },
+        "shap_sample_rows": total["shap_rows"],
+        "feature_attributions": sorted(attributions, key=lambda x: x["mean_abs_shap"], reverse=True),
+    }
+
+
+def run_job(job_id, path, chunksize, workers, shap_sample):
+    status = read_status(job_id)
+    lock = threading.Lock()
+    stopped = threading.Event()
+
+    def save(**changes):
+        # Called from the job and the heartbeat thread
+        with lock:
+            status.update(changes, heartbeat=time.time())
+            _write_json(_status_path(job_id), status)
+
+    def heartbeat():
+        while not stopped.wait(HEARTBEAT_INTERVAL):
+            save()
+
+    threading.Thread(target=heartbeat, daemon=True).start()
+    try:
+        bundle = model.get_bundle()
+        columns = list(bundle["columns"])
+        total_rows = count_rows(path)
+        save(state="running", total_rows=total_rows, model_version=bundle["version"])
+        total = {
+            "rows": 0, "invalid_rows": 0, "unknown_categories": {}, "risk_sum": 0.0, "tiers": [0] * len(RISK_TIERS), "histogram": [0] * 10,
+            "segments": {}, "shap_rows": 0,
+            "shap_sum": np.zeros(len(columns)), "shap_abs_sum": np.zeros(len(columns)),
+        }
+        start = time.perf_counter()
+
+        def progress(futures):
+            for future in futures:
+                _merge(total, future.result())
+            elapsed = time.perf_counter() - start
+            save(
+                rows_scored=total["rows"] - total["invalid_rows"],
+                invalid_rows=total["invalid_rows"],
+                unknown_categories=total["unknown_categories"],
+                progress=total["rows"] / total_rows if total_rows else 1.0,
+                elapsed_seconds=elapsed,
+                rows_per_second=total["rows"] / elapsed if elapsed > 0 else None,
+            )
+
+        # forkserver/spawn rather than fork: this runs in a thread of a
+        # multi-threaded server process
+        methods = multiprocessing.get_all_start_methods()
+        context = multiprocessing.get_context("forkserver" if "forkserver" in methods else "spawn")
+        initargs = (bundle["base_clf"], bundle["calibration"], bundle["columns"], bundle["categories"])
+        shap_fraction = min(1.0, shap_sample / total_rows) if total_rows else 0.0
+        with ProcessPoolExecutor(workers, mp_context=context, initializer=_init_worker, initargs=initargs) as pool:
+            pending = set()
+            for i, chunk in enumerate(pd.read_csv(path, chunksize=chunksize)):
+                pending.add(pool.submit(score_chunk, chunk, shap_fraction, i))
+                # Bound the chunks held in memory to two per worker
+                if len(pending) >= 2 * workers:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    progress(done)
+            progress(pending)
+
+        # The report must exist before the status says it does
+        finished = {"state": "completed", "progress": 1.0, "finished_at": time.time()}
+        _write_json(report_path(job_id), _build_report({**status, **finished}, total, columns))
+        save(**finished, report=f"/api/cohort-jobs/{job_id}/report")
+    except Exception as e:
+        save(state="failed", error=str(e), finished_at=time.time())
+    finally:
+        stopped.set()
+        _jobs.pop(job_id, None)
+
+
+def start_job(path, chunksize=50000, workers=None, shap_sample=2000, background=True):
+    """Queue a job for a cohort file in COHORT_DIR and return its status"""
+    full_path = resolve_cohort_path(path)
+    if chunksize <= 0:
+        raise ValueError("chunksize must be positive")
+    if shap_sample < 0:
+        raise ValueError("shap_sample can't be negative")
+    # Never more scoring processes than cores, whatever the request asks for
+    cpus = os.cpu_count() or 1
+    workers = min(max(workers or cpus, 1), cpus)
+    os.makedirs(REPORTS_DIR, exist_ok=True)
+    job_id = uuid.uuid4().hex[:12]
+    status = {
+        "job_id": job_id,
+        "state": "queued",
+        "source": path,
+        "chunksize": chunksize,
+        "workers": workers,
+        "shap_sample": shap_sample,
+        "created_at": time.time(),
+        "pid": os.getpid(),
+        "heartbeat": time.time(),
+        "rows_scored": 0,
+        "invalid_rows": 0,
+        "unknown_categories": {},
+        "total_rows": None,
+        "progress": 0.0,
+    }
+    # The lock file makes check-then-create atomic across server processes
+    with open(os.path.join(REPORTS_DIR, ".jobs.lock"), "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        active = [job for job in list_jobs() if job["state"] in ACTIVE_STATES]
+        if len(active) >= MAX_JOBS:
+            raise ValueError(f"{len(active)} cohort job(s) already running (limit {MAX_JOBS}); try again later")
+        _write_json(_status_path(job_id), status)
+    args = (job_id, full_path, chunksize, workers, shap_sample)
+    if not background:
+        run_job(*args)
+        return read_status(job_id)
+    thread = threading.Thread(target=run_job, args=args, daemon=True)
+    _jobs[job_id] = thread
+    thread.start()
+    return status
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Score a cohort CSV and write a risk-stratification report")
+    parser.add_argument("path", help=f"cohort CSV, relative to {COHORT_DIR}")
+    parser.add_argument("--chunksize", type=int, default=50000)
+    parser.add_argument("--workers", type=int, help="scoring processes (default and maximum: CPU count)")
+    parser.add_argument("--shap-sample", type=int, default=2000, help="patients explained for mean SHAP")
+    args = parser.parse_args()
+
+    status = start_job(args.path, args.chunksize, args.workers, args.shap_sample, background=False)
+    if status["state"] != "completed":
+        print(f"❌ Cohort job failed: {status.get('error')}", file=sys.stderr)
+        sys.exit(1)
+    print(f"✅ Scored {status['rows_scored']} patients in {status['elapsed_seconds']:.1f}s "
+          f"({status['rows_per_second']:.0f} rows/s, {status['workers']} workers)")
+    if status["invalid_rows"]:
+        print(f"⚠️  Skipped {status['invalid_rows']} rows with unknown categories: "
+              f"{json.dumps(status['unknown_categories'])}")
+    print(f"📄 Report written to {report_path(status['job_id'])}")
+
+
+if __name__ == "__main__":
+    main()
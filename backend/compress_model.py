@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Model compression for BoneHealth AI Backend
+Searches smaller, shallower and pruned forests and selects the smallest one
+(by total tree nodes) whose cross-validated ROC-AUC and recall stay within
+--tolerance of the current model. Every candidate is reported with its node
+count, pickled size, single-row predict latency and SHAP latency.
+
+Usage (from the backend folder):
+    python compress_model.py --output compression.json
+    python compress_model.py --tolerance 0.005 --write
+
+--write saves the selected parameters to model.PARAMS_PATH
+(./data/model_params.json), which model.fit_model() uses on the next start.
+"""
+
+import argparse
+import itertools
+import json
+import pickle
+import sys
+import time
+
+import numpy as np
+import shap
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.model_selection import StratifiedKFold, cross_validate
+
+import model
+
+
+def latency_ms(fn, repeat):
+    """Median wall time of fn() in milliseconds"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return float(np.median(times) * 1000)
+
+
+def evaluate(params, X, y, sample_weight, cv, repeat):
+    # Training data has one row per patient (classes are balanced by weight,
+    # not duplicated rows), so plain stratified folds can't leak a patient
+    scores = cross_validate(RandomForestClassifier(**params), X, y, cv=cv,
+                            scoring=["roc_auc", "recall"], params={"sample_weight": sample_weight})
+    clf = RandomForestClassifier(**params).fit(X, y, sample_weight=sample_weight)
+    explainer = shap.TreeExplainer(clf)
+    row = X.iloc[[0]]
+    return {
+        "params": params,
+        "roc_auc": float(np.mean(scores["test_roc_auc"])),
+        "recall": float(np.mean(scores["test_recall"])),
+        "node_count": int(sum(tree.tree_.node_count for tree in clf.estimators_)),
+        "max_depth": int(max(tree.tree_.max_depth for tree in clf.estimators_)),
+        "artifact_bytes": len(pickle.dumps(clf)),
+        "predict_ms": latency_ms(lambda: clf.predict_proba(row), repeat),
+        "shap_ms": latency_ms(lambda: explainer.shap_values(row), repeat),
+    }
+
+
+def _values(text, cast):
+    return [None if v == "None" else cast(v) for v in text.split(",")]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Search for a smaller forest with the same accuracy")
+    parser.add_argument("--n-estimators", default="25,50,100")
+    parser.add_argument("--max-depth", default="4,6,8,12,None")
+    parser.add_argument("--min-samples-leaf", default="1,5,20")
+    parser.add_argument("--ccp-alpha", default="0,0.001,0.005",
+                        help="cost-complexity pruning strengths")
+    parser.add_argument("--tolerance", type=float, default=0.01,
+                        help="allowed drop in CV ROC-AUC and recall versus the current model")
+    parser.add_argument("--folds", type=int, default=5)
+    parser.add_argument("--repeat", type=int, default=20, help="timed calls per latency measurement")
+    parser.add_argument("--output", help="write the JSON report to this file instead of stdout")
+    parser.add_argument("--write", action="store_true",
+                        help=f"save the selected parameters to {model.PARAMS_PATH}")
+    args = parser.parse_args()
+
+    X, y, sample_weight = model.load_training_data()
+    cv = StratifiedKFold(n_splits=args.folds, shuffle=True, random_state=42)
+
+    reference = evaluate(dict(model.FOREST_PARAMS), X, y, sample_weight, cv, args.repeat)
+    print(f"Current model: ROC-AUC {reference['roc_auc']:.4f}, recall {reference['recall']:.4f}, "
+          f"{reference['node_count']} nodes", file=sys.stderr)
+
+    grid = itertools.product(
+        _values(args.n_estimators, int),
+        _values(args.max_depth, int),
+        _values(args.min_samples_leaf, int),
+        _values(args.ccp_alpha, float),
+    )
+    candidates = []
+    for n_estimators, max_depth, min_samples_leaf, ccp_alpha in grid:
+        params = dict(model.FOREST_PARAMS, n_estimators=n_estimators, max_depth=max_depth,
+                      min_samples_leaf=min_samples_leaf, ccp_alpha=ccp_alpha)
+        result = evaluate(params, X, y, sample_weight, cv, args.repeat)
+        result["within_tolerance"] = (
+            result["roc_auc"] >= reference["roc_auc"] - args.tolerance
+            and result["recall"] >= reference["recall"] - args.tolerance
+        )
+        candidates.append(result)
+        print(f"{'✅' if result['within_tolerance'] else '❌'} {params}: ROC-AUC {result['roc_auc']:.4f}, "
+              f"recall {result['recall']:.4f}, {result['node_count']} nodes", file=sys.stderr)
+
+    accepted = [c for c in candidates if c["within_tolerance"]]
+    selected = min(accepted, key=lambda c: (c["node_count"], c["predict_ms"])) if accepted else None
+    report = {
+        "tolerance": args.tolerance,
+        "reference": reference,
+        "selected": selected,
+        "candidates": sorted(candidates, key=lambda c: c["node_count"]),
+    }
+    if selected is not None:
+        report["reduction"] = {
+            "node_count": 1 - selected["node_count"] / reference["node_count"],
+            "artifact_bytes": 1 - selected["artifact_bytes"] / reference["artifact_bytes"],
+            "predict_ms": 1 - selected["predict_ms"] / reference["predict_ms"],
+            "shap_ms": 1 - selected["shap_ms"] / reference["shap_ms"],
+        }
+
+    if args.write:
+        if selected is None:
+            print("❌ No candidate within tolerance; keeping the current parameters", file=sys.stderr)
+        else:
+            with open(model.PARAMS_PATH, "w") as f:
+                json.dump(selected["params"], f, indent=2)
+            print(f"✅ Saved {selected['params']} to {model.PARAMS_PATH}", file=sys.stderr)
+
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+    else:
+        print(output)
+
+
+if __name__ == "__main__":
+    main()
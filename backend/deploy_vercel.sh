@@ -79,7 +79,7 @@ if vercel --prod; then
     echo "  • Predictions: https://your-project.vercel.app/api/predict"
     echo ""
     print_status "To test your deployment:"
-    echo "  python test_network.py https://your-project.vercel.app"
+    echo "  curl https://your-project.vercel.app/health"
     echo ""
     print_status "To view logs:"
     echo "  vercel logs"
@@ -0,0 +1,26 @@
+# Gunicorn configuration for BoneHealth AI Backend
+# Usage: gunicorn main:app -c gunicorn.conf.py
+#
+# The master loads the model, encoder columns and SHAP explainer once and then
+# forks the workers, which inherit them copy-on-write instead of each training
+# their own copy.
+
+import gc
+import multiprocessing
+import os
+
+bind = f"{os.environ.get('HOST', '0.0.0.0')}:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+worker_class = "uvicorn.workers.UvicornWorker"
+preload_app = True
+timeout = 120
+loglevel = os.environ.get("LOG_LEVEL", "info")
+
+
+def on_starting(server):
+    import model
+
+    model.get_bundle()
+    # Move everything allocated so far out of the GC's reach so collections in
+    # the workers don't touch (and copy) the shared pages
+    gc.freeze()
@@ -1,10 +1,33 @@
 from typing import Union
+from contextlib import asynccontextmanager
+import os
+import threading
 
-from fastapi import FastAPI
+from fastapi import FastAPI, Response
 from api import router
 from fastapi.middleware.cors import CORSMiddleware
 
-app = FastAPI()
+import model
+
+
+def _load_model():
+    try:
+        model.get_bundle()
+    except Exception:
+        # Recorded by model.warmup_status() and reported through /ready
+        pass
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Under gunicorn --preload the master has already warmed up.
+    # Otherwise warm up in the background so /health answers meanwhile.
+    if not model.is_loaded():
+        threading.Thread(target=_load_model, daemon=True).start()
+    yield
+
+
+app = FastAPI(lifespan=lifespan)
 
 # Allow CORS for local frontend
 app.add_middleware(
@@ -20,4 +43,23 @@ app.add_middleware(
 def read_root():
     return {"Hello": "World"}
 
+@app.get("/health")
+def health_check():
+    return {"status": "healthy", "service": "bonehealth-ai-backend"}
+
+@app.get("/ready")
+def readiness_check(response: Response):
+    # Only route traffic to a worker once its warmup has finished
+    warmup = model.warmup_status()
+    if model.is_loaded():
+        status = "ready"
+    elif warmup["error"]:
+        # Warmup raised; a slow worker and a broken one need different fixes
+        status = "failed"
+    else:
+        status = "warming"
+    if status != "ready":
+        response.status_code = 503
+    return {"status": status, "pid": os.getpid(), "warmup": warmup}
+
 app.include_router(router, prefix="/api", tags=["Data Science"])
@@ -0,0 +1,493 @@
+"""
+Model loading for BoneHealth AI Backend
+The forest, its calibration map, the training columns and the SHAP explainer are built
+once per process and shared by every request. Under gunicorn with
+preload_app the master builds them before forking, so workers inherit them
+copy-on-write instead of each training their own.
+
+Loading is a timed warmup: read the data, fit the model, build the
+explainer, then push synthetic patients through scoring and SHAP so the
+first real request doesn't pay for any lazy initialisation.
+
+Calibration reuses the forest's out-of-bag probabilities: each training row
+is scored only by the trees that didn't see it, an isotonic fit maps those
+raw scores to calibrated risk, and the map is kept as a small monotone
+lookup table. The forest is fitted once, and SHAP explains the same forest
+that produces the score. Classes are balanced with sample weights rather
+than by upsampling, because a duplicated row can sit in the bootstrap of a
+tree that is out-of-bag for its copy, which makes the OOB scores leak.
+
+For large cohorts set BONEHEALTH_TRAINING=chunked: the CSV is read in
+chunks and each chunk is one-hot encoded into a stratified random sample of
+at most MAX_TRAINING_ROWS rows, preallocated as a float32 matrix. Each tree
+only bootstraps MAX_SAMPLES_PER_TREE rows anyway, so memory stays fixed
+however large the cohort is, while class weights still come from the counts
+of the whole file. The features are the same as in the default mode, so
+serving and explanations don't change.
+"""
+
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+import shap
+from sklearn.ensemble import RandomForestClassifier
+from sklearn.isotonic import IsotonicRegression
+
+DATA_PATH = "./data/osteoporosis.csv"
+# Forest parameters chosen by compress_model.py --write, if present
+PARAMS_PATH = os.environ.get("BONEHEALTH_MODEL_PARAMS", "./data/model_params.json")
+
+FOREST_PARAMS = {"n_estimators": 100, "random_state": 42}
+
+# "default" loads the CSV in one go and upsamples; "chunked" is for cohorts
+# too large for that (see load_training_data_chunked)
+TRAINING_MODE = os.environ.get("BONEHEALTH_TRAINING", "default")
+CHUNK_SIZE = int(os.environ.get("BONEHEALTH_CHUNK_SIZE", 500000))
+# Chunked mode trains on a sample of at most this many rows (holdout included)
+MAX_TRAINING_ROWS = int(os.environ.get("BONEHEALTH_MAX_TRAINING_ROWS", 1000000))
+# Chunked mode bounds tree size by the bootstrap size rather than the cohort size
+MAX_SAMPLES_PER_TREE = 500000
+CHUNKED_MIN_SAMPLES_LEAF = 20
+# Share of rows held out of the forest to fit the calibration in chunked mode
+CALIBRATION_FRACTION = 0.05
+
+# Part of the model version, so cached results from older code are never
+# served. Bump it whenever scoring or the /predict response format changes.
+RESULT_SCHEMA = 1
+
+# PredictRequest field names -> dataset column names, which the frontend sends
+FIELD_ALIASES = {
+    "Hormonal_Changes": "Hormonal Changes",
+    "Family_History": "Family History",
+    "Race_Ethnicity": "Race/Ethnicity",
+    "Body_Weight": "Body Weight",
+    "Calcium_Intake": "Calcium Intake",
+    "Vitamin_D_Intake": "Vitamin D Intake",
+    "Physical_Activity": "Physical Activity",
+    "Alcohol_Consumption": "Alcohol Consumption",
+    "Medical_Conditions": "Medical Conditions",
+    "Prior_Fractures": "Prior Fractures",
+}
+
+# Synthetic requests used to prime the inference path during warmup
+WARMUP_PATIENTS = [
+    {
+        "Age": 68, "Gender": "Female", "Hormonal Changes": "Postmenopausal",
+        "Family History": "Yes", "Race/Ethnicity": "Asian", "Body Weight": "Underweight",
+        "Calcium Intake": "Low", "Vitamin D Intake": "Insufficient",
+        "Physical Activity": "Sedentary", "Smoking": "Yes", "Alcohol Consumption": "Moderate",
+        "Medical Conditions": "Rheumatoid Arthritis", "Medications": "Corticosteroids",
+        "Prior Fractures": "Yes"
+    },
+    {
+        "Age": 30, "Gender": "Male", "Hormonal Changes": "Normal",
+        "Family History": "No", "Race/Ethnicity": "Caucasian", "Body Weight": "Normal",
+        "Calcium Intake": "Adequate", "Vitamin D Intake": "Sufficient",
+        "Physical Activity": "Active", "Smoking": "No", "Alcohol Consumption": "None",
+        "Medical Conditions": "None", "Medications": "None", "Prior Fractures": "No"
+    },
+]
+
+_bundle = None
+_error = None
+_lock = threading.Lock()
+# Warmup progress: the stage currently running and seconds spent per stage
+_stage = None
+_timings = {}
+
+
+def load_training_data(path=DATA_PATH):
+    """Load the dataset and return the one-hot encoded X and y, and sample
+    weights that give each class half the total weight"""
+    df = pd.read_csv(path)
+    # Synthetically generate nuanced negative cases for demo if needed
+    if (df["Osteoporosis"] == 0).sum() < 10:
+        # Seeded so every process (and every restart) trains the same model
+        rng = random.Random(42)
+        n = min(500, len(df))
+        df_pos = df[df["Osteoporosis"] == 1].sample(n, random_state=42, replace=True)
+        negs = []
+        for i, row in df_pos.iterrows():
+            r = row.copy()
+            p = rng.random()
+            if p < 0.6:  # 60% low risk
+                r["Age"] = rng.randint(18, 40)
+                r["Gender"] = "Male"
+                r["Hormonal Changes"] = "Normal"
+                r["Family History"] = "No"
+                r["Body Weight"] = "Normal"
+                r["Calcium Intake"] = "Adequate"
+                r["Vitamin D Intake"] = "Sufficient"
+                r["Physical Activity"] = "Active"
+                r["Smoking"] = "No"
+                r["Alcohol Consumption"] = "None"
+                r["Medical Conditions"] = "None"
+                r["Medications"] = "None"
+                r["Prior Fractures"] = "No"
+            else:
+                if p < 0.9:  # 30% moderate risk
+                    r["Age"] = rng.randint(41, 60)
+                else:  # 10% borderline
+                    r["Age"] = rng.randint(61, 75)
+                r["Gender"] = rng.choice(["Male", "Female"])
+                r["Hormonal Changes"] = rng.choice(["Normal", "Postmenopausal"])
+                r["Family History"] = rng.choice(["No", "Yes"])
+                r["Body Weight"] = rng.choice(["Normal", "Underweight"])
+                r["Calcium Intake"] = rng.choice(["Adequate", "Low"])
+                r["Vitamin D Intake"] = rng.choice(["Sufficient", "Insufficient"])
+                r["Physical Activity"] = rng.choice(["Active", "Sedentary"])
+                r["Smoking"] = rng.choice(["No", "Yes"])
+                r["Alcohol Consumption"] = rng.choice(["None", "Moderate"])
+                r["Medical Conditions"] = rng.choice(["None", "Rheumatoid Arthritis", "Hyperthyroidism"])
+                r["Medications"] = rng.choice(["None", "Corticosteroids"])
+                r["Prior Fractures"] = rng.choice(["No", "Yes"])
+            r["Osteoporosis"] = 0
+            negs.append(r)
+        df_neg = pd.DataFrame(negs)
+        df = pd.concat([df, df_neg], axis=0).reset_index(drop=True)
+    X = df.drop(columns=["Osteoporosis"])
+    y = df["Osteoporosis"]
+    # Remove Id column if present
+    if 'Id' in X.columns:
+        X = X.drop(columns=['Id'])
+    X = pd.get_dummies(X)
+    return X, y, balanced_weights(y.to_numpy())
+
+
+def balanced_weights(y):
+    """Per-row weights giving each class half the total, the balance
+    upsampling used to give"""
+    counts = np.bincount(y, minlength=2)
+    if counts.min() == 0:
+        return np.ones(len(y), dtype=np.float32)
+    return (len(y) / (2 * counts))[y].astype(np.float32)
+
+
+def load_training_data_chunked(path=DATA_PATH, chunksize=CHUNK_SIZE, max_rows=MAX_TRAINING_ROWS):
+    """Encode a stratified sample of a large CSV into a float32 one-hot
+    matrix in two passes.
+
+    The first pass collects the categories of each text column and the
+    class counts, which fix how many rows of each class the sample keeps
+    (all of them if the file has at most max_rows). The second encodes one
+    chunk at a time into a preallocated max_rows matrix, keeping the rows
+    with the smallest random keys per class, so peak memory is the sample
+    plus one chunk whatever the file size. Columns match pd.get_dummies:
+    numeric columns first, then each categorical field's categories in
+    sorted order.
+
+    Returns X, y, sample weights balancing the classes of the whole file,
+    and a mask of the rows held out for calibration.
+    """
+    order = None
+    text_columns = set()
+    categories = {}
+    class_counts = np.zeros(2, dtype=np.int64)
+    for chunk in pd.read_csv(path, chunksize=chunksize):
+        chunk = chunk.drop(columns=["Id"], errors="ignore")
+        class_counts += np.bincount(chunk.pop("Osteoporosis").to_numpy(), minlength=2)[:2]
+        if order is None:
+            order = list(chunk.columns)
+        for column in chunk.columns:
+            if not pd.api.types.is_numeric_dtype(chunk[column]):
+                text_columns.add(column)
+                categories.setdefault(column, set()).update(chunk[column].dropna().unique())
+    if class_counts.min() == 0:
+        raise ValueError("Chunked training needs both classes in the data")
+
+    numeric = [c for c in order if c not in text_columns]
+    fields = [c for c in order if c in text_columns]
+    categories = {field: sorted(categories[field]) for field in fields}
+    columns = list(numeric)
+    offsets = {}
+    for field in fields:
+        offsets[field] = len(columns)
+        columns += [f"{field}_{value}" for value in categories[field]]
+
+    # Rows kept per class, proportional to the class counts
+    total = int(class_counts.sum())
+    if total > max_rows:
+        quota = np.clip(class_counts * max_rows // total, 1, class_counts)
+    else:
+        quota = class_counts
+    first = np.concatenate([[0], np.cumsum(quota)])
+    n = int(first[-1])
+    X = np.zeros((n, len(columns)), dtype=np.float32)
+    y = np.repeat(np.arange(2, dtype=np.int8), quota)
+    # Bottom-k sampling: each row draws a key and a class keeps its smallest keys
+    keys = np.full(n, np.inf)
+    rng = np.random.default_rng(42)
+    for chunk in pd.read_csv(path, chunksize=chunksize, dtype={field: "category" for field in fields}):
+        rows = np.arange(len(chunk))
+        values = np.zeros((len(chunk), len(columns)), dtype=np.float32)
+        for j, column in enumerate(numeric):
+            values[:, j] = chunk[column].to_numpy(dtype=np.float32, na_value=np.nan)
+        for field in fields:
+            # Integer codes against the global category list (-1 for missing)
+            codes = pd.Categorical(chunk[field], categories=categories[field]).codes
+            present = codes >= 0
+            values[rows[present], offsets[field] + codes[present]] = 1
+        chunk_keys = rng.random(len(chunk))
+        labels = chunk["Osteoporosis"].to_numpy()
+        for label in (0, 1):
+            slots = np.arange(first[label], first[label + 1])
+            members = np.flatnonzero(labels == label)
+            candidates = np.concatenate([keys[slots], chunk_keys[members]])
+            winners = np.argpartition(candidates, len(slots) - 1)[:len(slots)]
+            incoming = members[winners[winners >= len(slots)] - len(slots)]
+            evicted = slots[np.setdiff1d(np.arange(len(slots)), winners[winners < len(slots)])]
+            X[evicted] = values[incoming]
+            keys[evicted] = chunk_keys[incoming]
+
+    # Balance the classes of the whole file, not just the sample
+    sample_weight = (total / (2 * class_counts))[y].astype(np.float32)
+    holdout = rng.random(n) < CALIBRATION_FRACTION
+    return pd.DataFrame(X, columns=columns, copy=False), pd.Series(y, name="Osteoporosis"), sample_weight, holdout
+
+
+def forest_params(path=PARAMS_PATH):
+    """FOREST_PARAMS, overridden by the compressed model's parameters if saved"""
+    params = dict(FOREST_PARAMS)
+    if os.path.exists(path):
+        with open(path) as f:
+            params.update(json.load(f))
+    return params
+
+
+def fit_model(X, y, sample_weight):
+    """Fit the class-weighted forest and an isotonic calibration of its
+    out-of-bag scores.
+
+    The isotonic fit is unweighted, so the calibrated risk matches how often
+    the outcome actually occurs at each score. Returns the forest and the
+    calibration as (raw score, calibrated risk) breakpoints for np.interp.
+    """
+    base_clf = RandomForestClassifier(**forest_params(), oob_score=True)
+    base_clf.fit(X, y, sample_weight=sample_weight)
+    oob = base_clf.oob_decision_function_[:, 1]
+    # Rows that landed in every tree's bootstrap have no out-of-bag score
+    seen = ~np.isnan(oob)
+    iso = IsotonicRegression(y_min=0, y_max=1, out_of_bounds="clip")
+    iso.fit(oob[seen], np.asarray(y)[seen])
+    return base_clf, (iso.X_thresholds_, iso.y_thresholds_)
+
+
+def fit_model_weighted(X, y, sample_weight, holdout):
+    """Fit the forest with class weights and calibrate it on held-out rows.
+
+    Out-of-bag scoring would copy most of X once per tree, so for large
+    cohorts the holdout rows get zero weight in the forest instead and the
+    isotonic map is fitted on their scores.
+    """
+    params = {
+        "min_samples_leaf": CHUNKED_MIN_SAMPLES_LEAF,
+        "max_samples": min(len(X), MAX_SAMPLES_PER_TREE),
+        **forest_params(),
+    }
+    base_clf = RandomForestClassifier(**params, n_jobs=-1)
+    base_clf.fit(X, y, sample_weight=np.where(holdout, 0, sample_weight))
+    # Requests score one row at a time; the workers already use the cores
+    base_clf.set_params(n_jobs=None)
+    raw = base_clf.predict_proba(X[holdout])[:, 1]
+    iso = IsotonicRegression(y_min=0, y_max=1, out_of_bounds="clip")
+    # Unweighted, like fit_model, so both modes calibrate to observed rates
+    iso.fit(raw, y[holdout])
+    return base_clf, (iso.X_thresholds_, iso.y_thresholds_)
+
+
+def predict_risk(bundle, input_df):
+    """Calibrated probability of osteoporosis for each row"""
+    raw = bundle["base_clf"].predict_proba(input_df)[:, 1]
+    return np.interp(raw, *bundle["calibration"])
+
+
+def explain(bundle, input_df):
+    """SHAP values of the forest's osteoporosis score, one row per input"""
+    shap_values = bundle["explainer"].shap_values(input_df)
+    if isinstance(shap_values, list):
+        # Older SHAP releases return one array per class
+        return shap_values[-1]
+    if shap_values.ndim == 3:
+        return shap_values[:, :, 1]
+    return shap_values
+
+
+def normalize(data):
+    """Validate a request payload and map it onto the dataset's column names"""
+    if not isinstance(data, dict):
+        raise ValueError("Request body must be a JSON object")
+    record = {FIELD_ALIASES.get(key, key): value for key, value in data.items()}
+    if "Age" in record:
+        # The prediction form sends Age as a string
+        try:
+            record["Age"] = int(float(record["Age"]))
+        except (TypeError, ValueError):
+            raise ValueError(f"Age must be a number, got {record['Age']!r}")
+        if not 0 <= record["Age"] <= 120:
+            raise ValueError(f"Age must be between 0 and 120, got {record['Age']}")
+    return record
+
+
+def validate(record, field_categories, required):
+    """Reject a normalized record with missing fields or unknown categories.
+
+    encode() turns anything it doesn't recognise into zeros, so without this
+    a misspelled field or category would be scored (and cached) as if the
+    patient had none of its options.
+    """
+    missing = [field for field in required if record.get(field) in (None, "")]
+    if missing:
+        raise ValueError(f"Missing required fields: {', '.join(missing)}")
+    for field, options in field_categories.items():
+        if record[field] not in options:
+            raise ValueError(f"{field} must be one of {', '.join(options)}, got {record[field]!r}")
+
+
+def categories(X):
+    """Categories of each one-hot encoded field, as the requests spell them.
+
+    A field whose one-hot columns are all zero for some rows had missing
+    values in the CSV (read as NaN from "None"), so "None" is a category too.
+    """
+    groups = {}
+    for column in X.columns:
+        if "_" in column:
+            field, value = column.split("_", 1)
+            groups.setdefault(field, []).append((value, column))
+    result = {}
+    for field, values in groups.items():
+        options = [value for value, _ in values]
+        # Column by column, so a large cohort isn't copied per field
+        any_set = np.zeros(len(X), dtype=bool)
+        for _, column in values:
+            any_set |= X[column].to_numpy() != 0
+        if not any_set.all():
+            options.append("None")
+        result[field] = options
+    return result
+
+
+def perturbations(record, field_categories, ages):
+    """Every single-field change to a patient: each other category of each
+    field, then each age in the sweep. Returns (field, value, record) tuples."""
+    changes = []
+    for field, options in field_categories.items():
+        for value in options:
+            if record.get(field) != value:
+                changes.append((field, value, {**record, field: value}))
+    for age in ages:
+        if record.get("Age") != age:
+            changes.append(("Age", age, {**record, "Age": age}))
+    return changes
+
+
+def model_version(X, y, base_clf, calibration):
+    """Short hash of the training data, model parameters, calibration map and
+    RESULT_SCHEMA"""
+    digest = hashlib.sha256()
+    digest.update(f"schema:{RESULT_SCHEMA}".encode())
+    digest.update(pd.util.hash_pandas_object(X, index=False).values.tobytes())
+    digest.update(pd.util.hash_pandas_object(y, index=False).values.tobytes())
+    digest.update(repr(sorted(base_clf.get_params().items())).encode())
+    for breakpoints in calibration:
+        digest.update(np.ascontiguousarray(breakpoints, dtype=np.float64).tobytes())
+    return digest.hexdigest()[:12]
+
+
+def encode(records, columns):
+    """One-hot encode request payloads and align them with the training columns.
+
+    Equivalent to pd.get_dummies followed by reindex(columns, fill_value=0),
+    but fills the matrix directly, which is several times faster per request.
+    Numbers pass through, strings set their "<field>_<value>" column, and
+    anything the model wasn't trained on (Id, unknown fields or categories)
+    is ignored.
+    """
+    position = {column: i for i, column in enumerate(columns)}
+    values = np.zeros((len(records), len(columns)))
+    for row, record in enumerate(records):
+        for field, value in record.items():
+            if isinstance(value, str):
+                i = position.get(f"{field}_{value}")
+                if i is not None:
+                    values[row, i] = 1
+            elif field in position and isinstance(value, (int, float)) and not isinstance(value, bool):
+                values[row, position[field]] = value
+    return pd.DataFrame(values, columns=columns)
+
+
+def prime(bundle):
+    """Score the synthetic patients one at a time, like real requests"""
+    input_df = encode(WARMUP_PATIENTS, bundle["columns"])
+    for i in range(len(input_df)):
+        row = input_df.iloc[[i]]
+        predict_risk(bundle, row)
+        explain(bundle, row)
+
+
+def _timed(stage, fn, *args):
+    global _stage
+    _stage = stage
+    start = time.perf_counter()
+    result = fn(*args)
+    _timings[stage] = time.perf_counter() - start
+    return result
+
+
+def build_bundle(path=DATA_PATH, mode=None):
+    """Run the warmup stages and return the model bundle"""
+    global _stage
+    if (mode or TRAINING_MODE) == "chunked":
+        X, y, sample_weight, holdout = _timed("data", load_training_data_chunked, path)
+        base_clf, calibration = _timed("model", fit_model_weighted, X, y, sample_weight, holdout)
+    else:
+        X, y, sample_weight = _timed("data", load_training_data, path)
+        base_clf, calibration = _timed("model", fit_model, X, y, sample_weight)
+    explainer = _timed("explainer", shap.TreeExplainer, base_clf)
+    bundle = {
+        "base_clf": base_clf,
+        "calibration": calibration,
+        "explainer": explainer,
+        "columns": X.columns,
+        "categories": categories(X),
+        "age_range": (int(X["Age"].min()), int(X["Age"].max())),
+        "version": model_version(X, y, base_clf, calibration),
+    }
+    _timed("prime", prime, bundle)
+    _stage = None
+    return bundle
+
+
+def get_bundle():
+    """Return the shared model bundle, building it on first use"""
+    global _bundle, _error
+    if _bundle is None:
+        with _lock:
+            if _bundle is None:
+                try:
+                    _bundle = build_bundle()
+                    _error = None
+                except Exception as e:
+                    _error = str(e)
+                    raise
+    return _bundle
+
+
+def is_loaded():
+    return _bundle is not None
+
+
+def warmup_status():
+    """Current warmup stage, per-stage timings in seconds and the last error"""
+    return {
+        "stage": _stage,
+        "timings": dict(_timings),
+        "total_seconds": sum(_timings.values()),
+        "error": _error,
+    }
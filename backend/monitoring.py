@@ -0,0 +1,248 @@
+"""
+Input drift monitoring for BoneHealth AI Backend
+Every valid /api/predict request updates per-feature category counts and an
+age histogram for this worker. The counts are compared against the training CSV
+with PSI and KL divergence when /api/drift is requested.
+
+The sketches use constant memory: ages fall into fixed 5-year bins and each
+field keeps at most MAX_CATEGORIES distinct values. They are updated without
+a lock, since only the worker's event loop thread writes to them. If
+BONEHEALTH_MONITOR_DIR is set, each worker also saves its counts there every
+BONEHEALTH_MONITOR_FLUSH seconds, and /api/drift merges the files of the
+workers that are still alive. Counts therefore cover the live workers since
+they started; a file whose worker has exited, or that hasn't been refreshed
+for a few flush intervals, is deleted rather than merged.
+"""
+
+import json
+import os
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+import model
+
+MONITOR_DIR = os.environ.get("BONEHEALTH_MONITOR_DIR") or None
+FLUSH_INTERVAL = float(os.environ.get("BONEHEALTH_MONITOR_FLUSH", 10))
+# Live workers rewrite their file every FLUSH_INTERVAL, so older ones are orphans
+STALE_AFTER = 3 * FLUSH_INTERVAL
+
+FIELDS = [
+    "Gender", "Hormonal Changes", "Family History", "Race/Ethnicity", "Body Weight",
+    "Calcium Intake", "Vitamin D Intake", "Physical Activity", "Smoking",
+    "Alcohol Consumption", "Medical Conditions", "Medications", "Prior Fractures",
+]
+AGE_BIN_WIDTH = 5
+AGE_BINS = 25  # 0-4, 5-9, ..., 115-119, 120+
+MAX_CATEGORIES = 32
+OTHER = "(other)"
+MISSING = "None"  # how the form and the CSV spell an absent value
+
+# Usual PSI reading: under 0.1 stable, 0.1-0.25 shifting, above 0.25 drifted
+PSI_WARN = 0.1
+PSI_ALERT = 0.25
+EPSILON = 1e-4  # smooths empty bins so PSI and KL stay finite
+
+
+class Sketch:
+    """Category counts per field plus an age histogram"""
+
+    def __init__(self):
+        self.count = 0
+        self.categories = {field: {} for field in FIELDS}
+        self.ages = [0] * AGE_BINS
+        self.age_missing = 0
+
+    def observe(self, record):
+        self.count += 1
+        for field, counts in self.categories.items():
+            value = record.get(field)
+            value = MISSING if value is None or value == "" else str(value)
+            if value not in counts and len(counts) >= MAX_CATEGORIES:
+                value = OTHER
+            counts[value] = counts.get(value, 0) + 1
+        age = record.get("Age")
+        if age is None:
+            self.age_missing += 1
+        else:
+            self.ages[min(max(int(age), 0) // AGE_BIN_WIDTH, AGE_BINS - 1)] += 1
+
+    def update(self, df):
+        """Add every row of a DataFrame with the dataset's columns"""
+        self.count += len(df)
+        for field, counts in self.categories.items():
+            values = df[field].fillna(MISSING) if field in df else pd.Series(MISSING, index=df.index)
+            for value, n in values.astype(str).value_counts().items():
+                if value not in counts and len(counts) >= MAX_CATEGORIES:
+                    value = OTHER
+                counts[value] = counts.get(value, 0) + int(n)
+        ages = pd.to_numeric(df["Age"], errors="coerce").to_numpy(dtype=float)
+        self.age_missing += int(np.isnan(ages).sum())
+        ages = ages[~np.isnan(ages)]
+        bins = np.minimum(np.maximum(ages, 0) // AGE_BIN_WIDTH, AGE_BINS - 1).astype(int)
+        self.ages = (np.asarray(self.ages) + np.bincount(bins, minlength=AGE_BINS)).tolist()
+
+    def merge(self, other):
+        self.count += other["count"]
+        for field, counts in other["categories"].items():
+            merged = self.categories.setdefault(field, {})
+            for value, n in counts.items():
+                merged[value] = merged.get(value, 0) + n
+        self.ages = [a + b for a, b in zip(self.ages, other["ages"])]
+        self.age_missing += other["age_missing"]
+
+    def to_dict(self):
+        # dict() copies are atomic under the GIL, so this can run while the
+        # event loop keeps observing
+        return {
+            "count": self.count,
+            "categories": {field: dict(counts) for field, counts in self.categories.items()},
+            "ages": list(self.ages),
+            "age_missing": self.age_missing,
+        }
+
+
+_sketch = Sketch()
+_flusher_pid = None
+_reference = None
+_reference_lock = threading.Lock()
+
+
+def _snapshot_path(pid):
+    return os.path.join(MONITOR_DIR, f"drift_{pid}.json")
+
+
+def flush():
+    """Save this worker's counts for other workers to merge"""
+    os.makedirs(MONITOR_DIR, exist_ok=True)
+    path = _snapshot_path(os.getpid())
+    tmp = f"{path}.tmp"
+    with open(tmp, "w") as f:
+        json.dump(_sketch.to_dict(), f)
+    os.replace(tmp, path)
+
+
+def _flush_loop():
+    while True:
+        time.sleep(FLUSH_INTERVAL)
+        try:
+            flush()
+        except OSError:
+            pass
+
+
+def observe(record):
+    """Count one normalized prediction request; called on the request path"""
+    global _flusher_pid
+    _sketch.observe(record)
+    # One flusher thread per worker, started after the fork
+    if MONITOR_DIR and _flusher_pid != os.getpid():
+        _flusher_pid = os.getpid()
+        threading.Thread(target=_flush_loop, daemon=True).start()
+
+
+def reference(path=None, chunksize=500000):
+    """Sketch of the training CSV, built once per process"""
+    global _reference
+    with _reference_lock:
+        if _reference is None:
+            sketch = Sketch()
+            for chunk in pd.read_csv(path or model.DATA_PATH, chunksize=chunksize):
+                sketch.update(chunk)
+            _reference = sketch.to_dict()
+        return _reference
+
+
+def _alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass  # exists, but belongs to another user
+    return True
+
+
+def production():
+    """This worker's counts merged with the saved counts of the other live workers"""
+    merged = Sketch()
+    merged.merge(_sketch.to_dict())
+    workers = [os.getpid()]
+    if MONITOR_DIR and os.path.isdir(MONITOR_DIR):
+        for name in os.listdir(MONITOR_DIR):
+            if not (name.startswith("drift_") and name.endswith(".json")):
+                continue
+            pid = name[len("drift_"):-len(".json")]
+            if not pid.isdigit() or int(pid) == os.getpid():
+                continue  # not a snapshot, or this worker's own
+            pid = int(pid)
+            path = os.path.join(MONITOR_DIR, name)
+            try:
+                if not _alive(pid) or time.time() - os.path.getmtime(path) > STALE_AFTER:
+                    # Left by a worker that exited (or a reused pid's predecessor)
+                    os.remove(path)
+                    continue
+                with open(path) as f:
+                    merged.merge(json.load(f))
+            except (OSError, ValueError):
+                continue
+            workers.append(pid)
+    return merged.to_dict(), workers
+
+
+def divergence(expected, actual):
+    """PSI and KL(actual || expected) between two aligned count vectors"""
+    expected = np.asarray(expected, dtype=float)
+    actual = np.asarray(actual, dtype=float)
+    p = np.maximum(actual / max(actual.sum(), 1), EPSILON)
+    q = np.maximum(expected / max(expected.sum(), 1), EPSILON)
+    p, q = p / p.sum(), q / q.sum()
+    return {
+        "psi": float(np.sum((p - q) * np.log(p / q))),
+        "kl": float(np.sum(p * np.log(p / q))),
+    }
+
+
+def _status(psi):
+    return "drift" if psi >= PSI_ALERT else "shift" if psi >= PSI_WARN else "stable"
+
+
+def drift_report():
+    ref = reference()
+    prod, workers = production()
+    features = {}
+    for field in FIELDS:
+        expected = ref["categories"].get(field, {})
+        actual = prod["categories"].get(field, {})
+        values = sorted(set(expected) | set(actual))
+        scores = divergence([expected.get(v, 0) for v in values], [actual.get(v, 0) for v in values])
+        features[field] = {
+            **scores,
+            "status": _status(scores["psi"]),
+            "training": {v: expected.get(v, 0) / max(ref["count"], 1) for v in values},
+            "production": {v: actual.get(v, 0) / max(prod["count"], 1) for v in values},
+            # Values the model never saw in training
+            "unseen": sorted(set(actual) - set(expected)),
+        }
+    scores = divergence(ref["ages"], prod["ages"])
+    features["Age"] = {
+        **scores,
+        "status": _status(scores["psi"]),
+        "bin_starts": [i * AGE_BIN_WIDTH for i in range(AGE_BINS)],
+        "training": ref["ages"],
+        "production": prod["ages"],
+        "missing": prod["age_missing"],
+    }
+    drifted = [field for field, f in features.items() if f["status"] == "drift"]
+    return {
+        "observations": prod["count"],
+        "training_rows": ref["count"],
+        "workers": sorted(workers),
+        # With few observations every feature looks drifted, so say so
+        "enough_data": prod["count"] >= 100,
+        "thresholds": {"psi_warn": PSI_WARN, "psi_alert": PSI_ALERT},
+        "drifted_features": drifted,
+        "features": features,
+    }
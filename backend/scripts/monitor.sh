@@ -3,7 +3,7 @@
 # BoneHealth AI Backend Monitoring Script
 # This script monitors the backend service and restarts it if it's down
 
-BACKEND_URL="http://localhost:8000/docs"
+BACKEND_URL="http://localhost:8000/health"
 LOG_FILE="/var/log/bonehealth-ai/monitor.log"
 PID_FILE="/var/run/bonehealth-ai.pid"
 RESTART_SCRIPT="/home/threatseal/projects/bonehealth_ai/bonehealth_ai/backend/start_server.sh"
@@ -17,7 +17,7 @@ fi
 
 # Check if required packages are installed
 echo "Checking dependencies..."
-python -c "import fastapi, uvicorn, pandas, sklearn, shap" 2>/dev/null
+python -c "import fastapi, uvicorn, gunicorn, pandas, sklearn, shap" 2>/dev/null
 if [ $? -ne 0 ]; then
     echo "Installing required packages..."
     pip install -r ../requirements.txt
@@ -34,5 +34,6 @@ echo "Port: $PORT"
 echo "API will be available at: http://$HOST:$PORT"
 echo "API Documentation: http://$HOST:$PORT/docs"
 
-# Start the server
-python -m uvicorn api:app --host $HOST --port $PORT --workers 1 --log-level info 
\ No newline at end of file
+# Start the server: the gunicorn master loads the model once and forks
+# WEB_CONCURRENCY workers that share it (defaults to the number of CPUs)
+gunicorn main:app -c gunicorn.conf.py 
\ No newline at end of file